@@ -0,0 +1,117 @@
+"""Admission control: bounded concurrency with a bounded waiting queue."""
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Optional
+
+import metrics
+
+
+class Overloaded(Exception):
+    """Raised when a request is not admitted.
+
+    Attributes:
+        retry_after (int): seconds after which a retry is likely to be admitted.
+    """
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Admit at most `max_concurrency` requests at once and queue at most `max_queue`.
+
+    Requests beyond the queue, or waiting longer than `queue_timeout` seconds,
+    fail fast with `Overloaded` instead of piling up.
+    Waiters are admitted in FIFO order.
+    Must be used from a single event loop.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_queue: int,
+        queue_timeout: Optional[float] = None,
+    ):
+        self.max_concurrency = max(max_concurrency, 1)
+        self.max_queue = max(max_queue, 0)
+        self.queue_timeout = queue_timeout or None
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._service_time = 1.0  # EWMA of the processing time in seconds
+
+    def retry_after(self) -> int:
+        """Estimate when the current backlog will have drained."""
+        backlog = len(self._waiters) / self.max_concurrency + 1
+        return max(1, math.ceil(self._service_time * backlog))
+
+    def _update_gauges(self) -> None:
+        metrics.ADMISSION_IN_FLIGHT.set(self.in_flight)
+        metrics.ADMISSION_QUEUE_DEPTH.set(len(self._waiters))
+
+    def _reject(self, reason: str, message: str) -> Overloaded:
+        metrics.ADMISSION_REJECTED.inc(reason)
+        return Overloaded(message, self.retry_after())
+
+    async def acquire(self) -> None:
+        if self.in_flight < self.max_concurrency and not self._waiters:
+            self.in_flight += 1
+            self._update_gauges()
+            metrics.ADMISSION_WAIT_SECONDS.observe(0.0)
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise self._reject("queue_full", "Server is busy: the queue is full.")
+
+        t0 = time.perf_counter()
+        fut = asyncio.get_event_loop().create_future()
+        self._waiters.append(fut)
+        self._update_gauges()
+        try:
+            await asyncio.wait({fut}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            if fut.done():
+                self.release()  # the slot was handed over but nobody uses it
+            else:
+                self._abandon(fut)
+            raise
+        if not fut.done():
+            self._abandon(fut)
+            raise self._reject(
+                "queue_timeout", "Server is busy: waited too long in the queue."
+            )
+        metrics.ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - t0)
+
+    def _abandon(self, fut: asyncio.Future) -> None:
+        self._waiters.remove(fut)
+        fut.cancel()
+        self._update_gauges()
+
+    def release(self) -> None:
+        # hand the slot over to the first waiter, if any
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                self._update_gauges()
+                return
+        self.in_flight -= 1
+        self._update_gauges()
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[None]:
+        """Hold an admission slot while the body runs.
+
+        Raises:
+            Overloaded: if the request cannot be admitted.
+        """
+        await self.acquire()
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            self._service_time = 0.9 * self._service_time + 0.1 * elapsed
+            self.release()
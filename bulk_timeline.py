@@ -0,0 +1,233 @@
+"""Convert many raw texts to HeaRT timelines offline.
+
+The stages are pipelined through bounded queues:
+JaMIE calls run concurrently in threads and feed a process pool
+that runs `from_xml`, `recover_all` and `main_lib`;
+results are appended to a JSONL file as they complete, in any order.
+
+The output file doubles as the checkpoint:
+a rerun with the same output skips inputs already written there.
+
+    $ JAMIE_ENDPOINT=http://localhost:51234/json python bulk_timeline.py reports/ out.jsonl --dct 2014-03-20
+"""
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator, Optional, Sequence, Set, Tuple, Union
+
+import fire
+from tqdm import tqdm
+
+import jamie
+from entity_types import Document
+from recover_omit import recover_all
+from visualise_time import SECTIONS, main_lib
+
+_DONE = object()  # end of a queue
+
+
+def iter_inputs(path: str, dct: Optional[str] = None) -> Iterator[dict]:
+    """Iterate over inputs as `{"id": ..., "text": ..., "dct": ...}`.
+
+    Args:
+        path (str): a JSONL file of `{"text": ..., "dct": ...}` with an optional "id"
+            (defaults to the line number), or a directory of `.txt` files
+            (the id is the relative path).
+        dct (str, optional): the DCT of inputs without one.
+    """
+    p = Path(path)
+    if p.is_file():
+        with open(p, "r") as f:
+            for i, line in enumerate(f):
+                if line.strip():
+                    rec = json.loads(line)
+                    yield {
+                        "id": str(rec.get("id", i)),
+                        "text": rec["text"],
+                        "dct": rec.get("dct") or dct,
+                    }
+    else:
+        for fp in sorted(p.glob("**/*.txt")):
+            yield {"id": str(fp.relative_to(p)), "text": fp.read_text(), "dct": dct}
+
+
+def read_checkpoint(output: Path, retry_failed: bool = False) -> Set[str]:
+    """Return ids already written to the output, dropping a torn last line."""
+    if not output.exists():
+        return set()
+    with open(output, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):  # killed while writing
+            f.truncate(data.rfind(b"\n") + 1)
+    done = set()
+    for line in data.splitlines():
+        try:
+            rec = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if rec.get("status") == "Success" or not retry_failed:
+            done.add(rec["id"])
+    return done
+
+
+def timeline_from_xml(
+    xml_text: str, dct: Optional[str], sections: Sequence[str]
+) -> Tuple[dict, float]:
+    """Run the CPU-bound stages in a worker process.
+
+    Returns:
+        Tuple[dict, float]: a response like the API's and the processing time.
+    """
+    t0 = time.perf_counter()
+    try:
+        doc = Document.from_xml(xml_text)
+        recover_all(doc)
+        res = {"status": "Success", "response": main_lib(doc, dct, sections)}
+    except Exception:
+        res = {"status": "Failed", "message": traceback.format_exc()}
+    return res, time.perf_counter() - t0
+
+
+def call_jamie(rec: dict) -> Union[str, dict]:
+    """Return JaMIE's XML, or a `Failed` response."""
+    try:
+        res = jamie.analyse(rec["text"])
+    except Exception:
+        return {"status": "Failed", "message": "JaMIE: " + traceback.format_exc()}
+    if res["status"] != "Success" or not res["text"]:
+        return {"status": "Failed", "message": "JaMIE: " + res.get("error", "empty")}
+    return "\n".join(res["text"])
+
+
+def main(
+    inputs: str,
+    output: str,
+    dct: Optional[str] = None,
+    sections: Union[str, Sequence[str], None] = None,
+    jamie_workers: int = 8,
+    procs: Optional[int] = None,
+    retry_failed: bool = False,
+):
+    """Convert texts to timelines and append them to a JSONL file.
+
+    Args:
+        inputs (str): a JSONL file or a directory of texts; see `iter_inputs`.
+        output (str): the output JSONL file, also used as the checkpoint.
+        dct (str, optional): the DCT of inputs without one.
+        sections (str or list, optional): sections to output (comma-separated).
+        jamie_workers (int): concurrent JaMIE calls.
+        procs (int, optional): worker processes. Defaults to the number of CPUs.
+        retry_failed (bool): set True to process again inputs that failed last time.
+    """
+    procs = procs or os.cpu_count() or 1
+    if isinstance(sections, str):
+        sections = sections.split(",")
+    sections = tuple(sections or SECTIONS)
+    assert set(sections) <= set(SECTIONS), f"choose sections from {SECTIONS}"
+    outp = Path(output)
+    done = read_checkpoint(outp, retry_failed)
+    todo = [rec for rec in iter_inputs(inputs, dct) if rec["id"] not in done]
+    print(f"{len(done)} done before, {len(todo)} to go", file=sys.stderr)
+
+    # bounded queues keep memory flat and let slow stages push back
+    q_text: "queue.Queue" = queue.Queue(maxsize=2 * jamie_workers)
+    q_xml: "queue.Queue" = queue.Queue(maxsize=2 * procs)
+    q_out: "queue.Queue" = queue.Queue(maxsize=4 * procs)
+    proc_slots = threading.Semaphore(2 * procs)
+    stats = {"jamie": 0.0, "process": 0.0}
+    stats_lock = threading.Lock()
+
+    def feed():
+        for rec in todo:
+            q_text.put(rec)
+        for _ in range(jamie_workers):
+            q_text.put(_DONE)
+
+    def analyse():
+        while True:
+            rec = q_text.get()
+            if rec is _DONE:
+                q_xml.put(_DONE)
+                return
+            t0 = time.perf_counter()
+            xml = call_jamie(rec)
+            with stats_lock:
+                stats["jamie"] += time.perf_counter() - t0
+            q_xml.put((rec, xml))
+
+    def dispatch(pool: ProcessPoolExecutor):
+        n_finished = 0
+        while n_finished < jamie_workers:
+            item = q_xml.get()
+            if item is _DONE:
+                n_finished += 1
+                continue
+            rec, xml = item
+            if isinstance(xml, dict):  # JaMIE failed
+                q_out.put((rec, xml))
+                continue
+            proc_slots.acquire()
+            fut = pool.submit(timeline_from_xml, xml, rec["dct"], sections)
+            fut.add_done_callback(lambda fut, rec=rec: collect(rec, fut))
+        for _ in range(2 * procs):  # wait for the submitted tasks to finish
+            proc_slots.acquire()
+        q_out.put(_DONE)
+
+    def collect(rec: dict, fut: Future):
+        try:
+            res, elapsed = fut.result()
+        except Exception:  # e.g. a worker process died
+            res, elapsed = {"status": "Failed", "message": traceback.format_exc()}, 0
+        with stats_lock:
+            stats["process"] += elapsed
+        q_out.put((rec, res))
+        proc_slots.release()  # after the put so that _DONE comes last
+
+    counts = {"Success": 0, "Failed": 0}
+    started = time.perf_counter()
+    # spawn rather than fork: this process runs threads
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=procs, mp_context=ctx) as pool, open(
+        outp, "a"
+    ) as f, tqdm(total=len(todo), unit="doc", file=sys.stderr) as pbar:
+        threads = [threading.Thread(target=feed, daemon=True)]
+        threads += [
+            threading.Thread(target=analyse, daemon=True) for _ in range(jamie_workers)
+        ]
+        threads.append(threading.Thread(target=dispatch, args=(pool,), daemon=True))
+        for t in threads:
+            t.start()
+        while True:
+            item = q_out.get()
+            if item is _DONE:
+                break
+            rec, res = item
+            f.write(json.dumps({"id": rec["id"], "dct": rec["dct"], **res}) + "\n")
+            f.flush()
+            counts[res["status"]] += 1
+            pbar.update()
+            pbar.set_postfix(failed=counts["Failed"], refresh=False)
+
+    elapsed = time.perf_counter() - started
+    n = sum(counts.values())
+    print(
+        f"{n} docs in {elapsed:.1f}s ({n / elapsed if elapsed else 0:.2f} docs/s): "
+        f"{counts['Success']} succeeded, {counts['Failed']} failed",
+        file=sys.stderr,
+    )
+    print(
+        f"time spent: jamie {stats['jamie']:.1f}s, "
+        f"processing {stats['process']:.1f}s over {procs} processes",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,111 @@
+"""In-process caches, and a cache shared among processes on the same host."""
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+import metrics
+
+
+class LRUCache:
+    """Thread-safe LRU cache of bounded size; hits and misses are counted in metrics."""
+
+    def __init__(self, name: str, maxsize: int):
+        self.name = name  # used as the metrics label
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+                value = self._data[key]
+            except KeyError:
+                value = None
+        metrics.CACHE_REQUESTS.inc(self.name, "miss" if value is None else "hit")
+        return value
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """Get a value without counting a hit or a miss or refreshing its recency."""
+        with self._lock:
+            return self._data.get(key)
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SharedCache:
+    """LRU-ish cache of picklable values in a SQLite file, shared by processes.
+
+    Keys are strings, stored as their SHA-256. Each process and thread opens
+    its own connection, so an instance may be created before `fork`.
+    Entries beyond `maxsize` are evicted by their last access time.
+    """
+
+    def __init__(self, name: str, path: str, maxsize: int):
+        self.name = name  # used as the metrics label
+        self.path = path
+        self.maxsize = maxsize
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache"
+                " (key TEXT PRIMARY KEY, value BLOB, atime REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_atime ON cache (atime)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @staticmethod
+    def _hash(key: str) -> str:
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        h = self._hash(key)
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM cache WHERE key = ?", (h,)).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE cache SET atime = ? WHERE key = ?", (time.time(), h)
+                )
+        metrics.CACHE_REQUESTS.inc(self.name, "miss" if row is None else "hit")
+        return None if row is None else pickle.loads(row[0])
+
+    def put(self, key: str, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?)",
+                (self._hash(key), blob, time.time()),
+            )
+            conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache"
+                " ORDER BY atime DESC LIMIT -1 OFFSET ?)",
+                (self.maxsize,),
+            )
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
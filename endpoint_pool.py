@@ -0,0 +1,155 @@
+"""Client-side load balancing over replicas of a backend API."""
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Deque, List, Optional, Sequence, TypeVar
+
+import metrics
+
+A = TypeVar("A")
+
+
+class Endpoint:
+    """A replica and its health."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0
+        self.failures = 0  # consecutive
+        self.ejected_until = 0.0
+
+    def is_healthy(self, now: float) -> bool:
+        return self.ejected_until <= now
+
+
+class EndpointPool:
+    """Send each call to the replica with the fewest outstanding requests.
+
+    A replica failing `eject_after` times in a row is ejected for `eject_seconds`
+    (passive health checking); the next call after that period probes it again.
+    If every replica is ejected, the one to come back first is used anyway.
+
+    With `hedge=True`, a call still running after the `hedge_quantile`-th
+    percentile of recent latencies is sent to another replica as well,
+    and the first successful response wins.
+    At most `hedge_budget` of the calls are hedged, so that a uniformly slow
+    period does not double the load.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        urls: Sequence[str],
+        eject_after: int = 3,
+        eject_seconds: float = 30.0,
+        hedge: bool = False,
+        hedge_quantile: float = 95.0,
+        hedge_min_samples: int = 20,
+        hedge_budget: float = 0.1,
+        window: int = 200,
+        max_workers: int = 64,
+    ):
+        assert urls, "No endpoints are given."
+        self.name = name  # used as the metrics label
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.hedge = hedge and len(self.endpoints) > 1
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_budget = hedge_budget
+        self._n_calls = 0
+        self._n_hedged = 0
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        if self.hedge:
+            self._executor = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix=f"{name}-hedge"
+            )
+
+    def _acquire(self, exclude: Optional[Endpoint] = None) -> Optional[Endpoint]:
+        with self._lock:
+            if exclude is None:
+                self._n_calls += 1
+            elif self._n_hedged >= self.hedge_budget * self._n_calls:
+                return None
+            now = time.monotonic()
+            candidates = [ep for ep in self.endpoints if ep is not exclude]
+            if not candidates:
+                return None
+            healthy = [ep for ep in candidates if ep.is_healthy(now)]
+            if healthy:
+                least = min(ep.outstanding for ep in healthy)
+                ep = random.choice([ep for ep in healthy if ep.outstanding == least])
+            elif exclude is not None:
+                return None  # do not hedge onto an ejected replica
+            else:
+                ep = min(candidates, key=lambda ep: ep.ejected_until)
+            ep.outstanding += 1
+            if exclude is not None:
+                self._n_hedged += 1
+            metrics.UPSTREAM_OUTSTANDING.set(ep.outstanding, self.name, ep.url)
+            return ep
+
+    def _release(self, ep: Endpoint, ok: bool, elapsed: float) -> None:
+        with self._lock:
+            ep.outstanding -= 1
+            metrics.UPSTREAM_OUTSTANDING.set(ep.outstanding, self.name, ep.url)
+            if ok:
+                ep.failures = 0
+                self._latencies.append(elapsed)
+                return
+            ep.failures += 1
+            if ep.failures >= self.eject_after:
+                ep.failures = 0
+                ep.ejected_until = time.monotonic() + self.eject_seconds
+                metrics.UPSTREAM_EJECTIONS.inc(self.name, ep.url)
+
+    def hedge_delay(self) -> Optional[float]:
+        """The latency percentile after which a call is hedged, if known yet."""
+        with self._lock:
+            if len(self._latencies) < self.hedge_min_samples:
+                return None
+            values = sorted(self._latencies)
+        ix = min(len(values) - 1, int(len(values) * self.hedge_quantile / 100))
+        return values[ix]
+
+    def _call_on(self, ep: Endpoint, fn: Callable[[str], A]) -> A:
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            res = fn(ep.url)
+            ok = True
+            return res
+        finally:
+            self._release(ep, ok, time.perf_counter() - t0)
+
+    def call(self, fn: Callable[[str], A]) -> A:
+        """Call `fn(url)` on a replica; an exception from `fn` counts as a failure."""
+        ep = self._acquire()
+        delay = self.hedge_delay() if self.hedge else None
+        if delay is None:
+            return self._call_on(ep, fn)
+
+        assert self._executor is not None
+        primary = self._executor.submit(self._call_on, ep, fn)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+        backup_ep = self._acquire(exclude=ep)
+        if backup_ep is None:
+            return primary.result()
+        metrics.UPSTREAM_HEDGED.inc(self.name, "fired")
+        backup = self._executor.submit(self._call_on, backup_ep, fn)
+        pending: List[Future] = [primary, backup]
+        while True:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                pending.remove(fut)
+                if fut.exception() is None or not pending:
+                    if fut is backup:
+                        metrics.UPSTREAM_HEDGED.inc(self.name, "won")
+                    return fut.result()
@@ -266,17 +266,17 @@ class Document:
             Document: a Document instance.
         """
         p = Path(fname_or_xmlstr)
-        if p.is_file() and p.suffix == ".xml":
+        try:
+            is_file = p.suffix == ".xml" and p.is_file()
+        except OSError:  # a long XML string is not a valid path
+            is_file = False
+        if is_file:
             root = ET.parse(p).getroot()
         else:
             root = ET.fromstring(f"<root>{fname_or_xmlstr}</root>")
         doc = Document()
         doc.txt = x2b.get_plain_text(root)
-        df, df_r = x2b.root_to_df(root, doc.txt)
-        tagstrs = x2b.df_to_tagstrs(df)
-        attrstrs = x2b.df_to_attrstrs(df)
-        relstrs = x2b.df_to_relstrs(df_r)
-        for annline in tagstrs + attrstrs + relstrs:
+        for annline in x2b.root_to_annstrs(root, doc.txt):
             doc._read_ann_line(annline)
         doc._build_doc()
         return doc
@@ -351,6 +351,77 @@ class Document:
         self.isbuilt = True
         self.update_needed = False
 
+    def __getstate__(self) -> dict:
+        """Pickle (and deepcopy) entities with relations as indices.
+
+        The default protocol fails because relation sets hash
+        not-yet-restored Entity objects.
+        """
+        state = self.__dict__.copy()
+        ixs = {id(e): i for i, e in enumerate(self.entities)}
+        state["entities"] = [
+            (
+                e.id,
+                e.tag,
+                e.span,
+                e.text,
+                e.attrs,
+                {k: [ixs[id(x)] for x in v] for k, v in e.rels_to.items()},
+                {k: [ixs[id(x)] for x in v] for k, v in e.rels_from.items()},
+            )
+            for e in self.entities
+        ]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        ents = state.pop("entities")
+        self.__dict__.update(state)
+        self.entities = []
+        for _id, tag, span, text, attrs, _, _ in ents:
+            e = Entity(_id, tag, span, text, doc=self)
+            e.attrs = attrs
+            self.entities.append(e)
+        for e, (_, _, _, _, _, rels_to, rels_from) in zip(self.entities, ents):
+            e.rels_to = {k: {self.entities[i] for i in v} for k, v in rels_to.items()}
+            e.rels_from = {
+                k: {self.entities[i] for i in v} for k, v in rels_from.items()
+            }
+
+    def fork(self) -> Document:
+        """Return an independent copy to run the pipeline again from this state.
+
+        Immutable data (IDs, tags, spans, texts, the raw text)
+        and the Attribute/Relation records are shared with this document;
+        records are replaced rather than modified, so sharing them is safe.
+        Only the per-entity attribute dicts and relation sets are copied,
+        since `relate_dct`, `normalise_all_timex` etc. modify them in place.
+        Entities refer to each other directly,
+        so the entity objects themselves have to be rebuilt for each fork.
+
+        Returns:
+            Document: a forked document.
+        """
+        self._validate()
+        doc = Document.__new__(Document)
+        doc.__dict__.update(self.__dict__)
+        forked: Dict[int, Entity] = {}
+        doc.entities = []
+        for e in self.entities:
+            f = Entity.__new__(Entity)
+            f.__dict__.update(e.__dict__)
+            f.attrs = e.attrs.copy()
+            f.parent_doc = doc
+            forked[id(e)] = f
+            doc.entities.append(f)
+        for f in doc.entities:
+            f.rels_to = {k: {forked[id(x)] for x in v} for k, v in f.rels_to.items()}
+            f.rels_from = {
+                k: {forked[id(x)] for x in v} for k, v in f.rels_from.items()
+            }
+        doc.attributes = self.attributes[:]
+        doc.relations = self.relations[:]
+        return doc
+
     def findby_id(self, _id: Id) -> Entity:
         """Find an entity specified by the ID"""
         es = [e for e in self.entities if e.id == _id]
@@ -373,11 +444,15 @@ class Document:
 
         e = self.findby_id(target)
         if attrtype in e.attrs and not self.update_needed:
-            # find an existing Attribute
-            attr = [
-                a for a in self.attributes if a.name == attrtype and a.target == target
+            # replace an existing Attribute; it may be shared with forks
+            ix = [
+                i
+                for i, a in enumerate(self.attributes)
+                if a.name == attrtype and a.target == target
             ][0]
-            attr.value = value
+            self.attributes[ix] = Attribute(
+                _id=self.attributes[ix].id, name=attrtype, target=target, value=value
+            )
         else:
             self.attr_id_max += 1
             new_attr = Attribute(
@@ -521,8 +596,7 @@ class Document:
 
             if cursor < ent.span[0]:
                 xmldoc.characters(self.txt[cursor : ent.span[0]])
-            attrdict = ent.attrs
-            attrdict["id"] = str(ent.id)
+            attrdict = dict(ent.attrs, id=str(ent.id))
             attr = xmlreader.AttributesImpl(attrdict)
             xmldoc.startElement(BRAT2XML[ent.tag], attr)
             assert (
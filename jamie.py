@@ -0,0 +1,150 @@
+"""Client of the JaMIE API."""
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+import requests
+
+import metrics
+from endpoint_pool import EndpointPool
+from singleflight import SingleFlight
+
+# Please specify a JaMIE endpoint URL here; comma-separated URLs of replicas are
+# balanced by the number of outstanding requests.
+JAMIE = os.environ["JAMIE_ENDPOINT"]
+TIMEOUT = float(os.environ.get("JAMIE_TIMEOUT", "0")) or None  # seconds
+
+# texts longer than this are split into chunks of sentences analysed in parallel;
+# 0 disables chunking
+CHUNK_CHARS = int(os.environ.get("JAMIE_CHUNK_CHARS", "0"))
+CHUNK_CONCURRENCY = int(os.environ.get("JAMIE_CHUNK_CONCURRENCY", "8"))
+
+PTN_SENTENCE_END = re.compile(r"(?<=[。．！？!?\n])")
+PTN_TAG = re.compile(r"<[^<>]+>")
+PTN_ID = re.compile(r'\b(tid|rid|arg1|arg2)="([A-Za-z]*)(\d+)"')
+PTN_BREL = re.compile(r"<brel\b[^<>]*?(?:/>|>\s*</brel>)")
+
+_flight = SingleFlight("jamie")
+_endpoints = EndpointPool(
+    "jamie",
+    [url.strip() for url in JAMIE.split(",") if url.strip()],
+    eject_after=int(os.environ.get("JAMIE_EJECT_AFTER", "3")),
+    eject_seconds=float(os.environ.get("JAMIE_EJECT_SECONDS", "30")),
+    hedge=os.environ.get("JAMIE_HEDGE", "0") == "1",
+    hedge_quantile=float(os.environ.get("JAMIE_HEDGE_QUANTILE", "95")),
+)
+_pool = ThreadPoolExecutor(max_workers=CHUNK_CONCURRENCY, thread_name_prefix="jamie")
+
+
+def _get(url: str, text: str) -> dict:
+    res = requests.get(url, params={"text": text}, timeout=TIMEOUT)
+    res.raise_for_status()
+    return res.json()
+
+
+def _request(text: str) -> dict:
+    return _endpoints.call(lambda url: _get(url, text))
+
+
+def _analyse_one(text: str) -> dict:
+    return _flight.do(text, _request, text)
+
+
+def _timed_chunk(text: str) -> dict:
+    with metrics.timed("jamie_chunk"):
+        return _analyse_one(text)
+
+
+def split_text(text: str, max_chars: int) -> List[str]:
+    """Split a text into chunks of whole sentences of at most `max_chars` each.
+
+    A sentence longer than `max_chars` makes a chunk by itself.
+    The chunks concatenate back to the original text.
+    """
+    chunks: List[str] = []
+    current = ""
+    for sentence in PTN_SENTENCE_END.split(text):
+        if current and len(current) + len(sentence) > max_chars:
+            chunks.append(current)
+            current = ""
+        current += sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def renumber_ids(xml: str, t_offset: int, r_offset: int) -> Tuple[str, int, int]:
+    """Shift entity (`tid`, `arg1`, `arg2`) and relation (`rid`) IDs in PRISM XML.
+
+    Returns:
+        Tuple[str, int, int]: the XML and the largest entity and relation IDs in it.
+    """
+    max_t, max_r = t_offset, r_offset
+
+    def shift_id(m: re.Match) -> str:
+        nonlocal max_t, max_r
+        key, prefix, num = m.group(1), m.group(2), int(m.group(3))
+        if key == "rid":
+            num += r_offset
+            max_r = max(max_r, num)
+        else:
+            num += t_offset
+            max_t = max(max_t, num)
+        return f'{key}="{prefix}{num}"'
+
+    xml = PTN_TAG.sub(lambda m: PTN_ID.sub(shift_id, m.group(0)), xml)
+    return xml, max_t, max_r
+
+
+def stitch(chunks: List[str], xmls: List[str]) -> str:
+    """Concatenate JaMIE's XML of chunks into the XML of the whole text.
+
+    IDs are renumbered to be unique over the whole document.
+    Whitespace around each chunk, which JaMIE may drop, is put back
+    so that character offsets in the plain text stay those of the original text.
+    Relations (`brel`) are moved after the whole text,
+    since offsets are not counted across them.
+    """
+    pieces, brels = [], []
+    t_offset, r_offset = 0, 0
+    for chunk, xml in zip(chunks, xmls):
+        body = chunk.strip()
+        lead = chunk[: len(chunk) - len(chunk.lstrip())]
+        trail = chunk[len(lead) + len(body) :]
+        xml, t_offset, r_offset = renumber_ids(xml, t_offset, r_offset)
+        brels += PTN_BREL.findall(xml)
+        pieces += [lead, PTN_BREL.sub("", xml).strip(), trail]
+    return "".join(pieces).rstrip() + "\n" + "".join(brels)
+
+
+def _analyse_chunked(text: str) -> dict:
+    chunks = split_text(text, CHUNK_CHARS)
+    bodies = [chunk.strip() for chunk in chunks]
+    futures = {body: _pool.submit(_timed_chunk, body) for body in set(bodies) if body}
+    xmls = []
+    for body in bodies:
+        if not body:
+            xmls.append("")
+            continue
+        res = futures[body].result()
+        if res["status"] != "Success":
+            return res
+        xmls.append("\n".join(res["text"]))
+    return {"status": "Success", "text": stitch(chunks, xmls).split("\n")}
+
+
+def analyse(text: str) -> dict:
+    """Call JaMIE; concurrent calls for the same text share one request.
+
+    A text longer than `CHUNK_CHARS` is split into chunks of sentences,
+    which are analysed in parallel and stitched back into one XML.
+
+    Returns:
+        dict: JaMIE's response, i.e. `{"status": "Success", "text": [...]}`
+            or `{"status": "Failure", "error": "..."}`.
+            The dict may be shared among callers, so do not modify it.
+    """
+    if CHUNK_CHARS > 0 and len(text) > CHUNK_CHARS:
+        return _flight.do(("chunked", text), _analyse_chunked, text)
+    return _analyse_one(text)
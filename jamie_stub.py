@@ -0,0 +1,142 @@
+"""A local stand-in of the JaMIE API for benchmarking.
+
+It serves pre-recorded PRISM XML files instead of analysing texts.
+A text is answered with the recorded XML of the same plain text if any,
+otherwise with a recorded XML chosen deterministically from the text.
+
+    $ python jamie_stub.py data/ --port 51234 --latency 0.5 --error_rate 0.01
+    $ JAMIE_ENDPOINT=http://localhost:51234/json uvicorn main:app --port 51235
+"""
+import asyncio
+import os
+import random
+import sys
+import xml.etree.ElementTree as ET
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import fire
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+import xml2brat as x2b
+
+app = FastAPI()
+
+CONFIG = {
+    "latency": float(os.environ.get("STUB_LATENCY", "0.5")),  # base seconds
+    "per_char": float(os.environ.get("STUB_PER_CHAR", "0")),  # seconds per char
+    "jitter": float(os.environ.get("STUB_JITTER", "0.1")),  # relative
+    "error_rate": float(os.environ.get("STUB_ERROR_RATE", "0")),  # Failure status
+    "crash_rate": float(os.environ.get("STUB_CRASH_RATE", "0")),  # HTTP 500
+}
+
+RECORDS: List[str] = []  # PRISM XML strings, without the root element
+BY_TEXT: Dict[str, str] = {}  # plain text -> PRISM XML
+
+
+def read_prism_xml(path: Path) -> Optional[str]:
+    """Read an XML file and return the PRISM-tagged content inside its real root."""
+    try:
+        root = x2b.get_real_root(ET.parse(path).getroot())
+    except ET.ParseError:  # 1-doc-per-file without a root element
+        with open(path, "r") as f:
+            return f.read().strip()
+    except StopIteration:  # no PRISM tags at all
+        return None
+    return (root.text or "") + "".join(
+        ET.tostring(child, encoding="unicode") for child in root
+    )
+
+
+def load_records(data_dir: str) -> None:
+    RECORDS.clear()
+    BY_TEXT.clear()
+    for path in sorted(Path(data_dir).glob("**/*.xml")):
+        xml = read_prism_xml(path)
+        if not xml:
+            continue
+        RECORDS.append(xml)
+        plain = x2b.get_plain_text(ET.fromstring(f"<root>{xml}</root>"))
+        BY_TEXT[plain.strip()] = xml
+    print(f"loaded {len(RECORDS)} records from {data_dir}", file=sys.stderr)
+
+
+def pick_record(text: str) -> str:
+    if text.strip() in BY_TEXT:
+        return BY_TEXT[text.strip()]
+    return RECORDS[zlib.crc32(text.encode("utf-8")) % len(RECORDS)]
+
+
+async def respond(text: str):
+    delay = CONFIG["latency"] + CONFIG["per_char"] * len(text)
+    delay *= 1 + random.uniform(-CONFIG["jitter"], CONFIG["jitter"])
+    await asyncio.sleep(max(delay, 0))
+
+    dice = random.random()
+    if dice < CONFIG["crash_rate"]:
+        return PlainTextResponse("Internal Server Error", status_code=500)
+    if dice < CONFIG["crash_rate"] + CONFIG["error_rate"]:
+        return JSONResponse({"status": "Failure", "error": "injected error"})
+    if not RECORDS:
+        return JSONResponse({"status": "Failure", "error": "no records loaded"})
+    return JSONResponse({"status": "Success", "text": pick_record(text).split("\n")})
+
+
+@app.on_event("startup")
+def startup():
+    if not RECORDS:
+        load_records(os.environ.get("STUB_DATA_DIR", "data"))
+
+
+@app.get("/json")
+async def analyse_get(text: str):
+    return await respond(text)
+
+
+@app.post("/json")
+async def analyse_post(request: Request):
+    if request.headers.get("content-type", "").startswith("application/json"):
+        text = (await request.json())["text"]
+    else:
+        text = (await request.form())["text"]
+    return await respond(text)
+
+
+def main(
+    data_dir: str = "data",
+    port: int = 51234,
+    host: str = "127.0.0.1",
+    latency: float = CONFIG["latency"],
+    per_char: float = CONFIG["per_char"],
+    jitter: float = CONFIG["jitter"],
+    error_rate: float = CONFIG["error_rate"],
+    crash_rate: float = CONFIG["crash_rate"],
+):
+    """Run the stub server.
+
+    Args:
+        data_dir (str): a directory of pre-recorded PRISM XML files.
+        port (int): port to listen.
+        host (str): host to bind.
+        latency (float): base latency of a response in seconds.
+        per_char (float): additional latency per input character in seconds.
+        jitter (float): relative jitter of the latency, e.g. 0.1 for +-10%.
+        error_rate (float): ratio of `{"status": "Failure"}` responses.
+        crash_rate (float): ratio of HTTP 500 responses.
+    """
+    CONFIG.update(
+        latency=latency,
+        per_char=per_char,
+        jitter=jitter,
+        error_rate=error_rate,
+        crash_rate=crash_rate,
+    )
+    load_records(data_dir)
+    uvicorn.run(app, host=host, port=port)
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,214 @@
+"""Load generator for the HeaRT API.
+
+Send requests at a fixed rate (open loop) and report the throughput,
+end-to-end latency percentiles and per-stage latency percentiles
+estimated from the server's `/metrics`.
+
+    $ python jamie_stub.py data/ &
+    $ JAMIE_ENDPOINT=http://localhost:51234/json uvicorn main:app --port 51235 &
+    $ python loadgen.py data/ --url http://localhost:51235/ --rate 20 --duration 60
+"""
+import json
+import re
+import sys
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urljoin
+
+import fire
+import requests
+
+import xml2brat as x2b
+from jamie_stub import read_prism_xml
+
+PTN_BUCKET = re.compile(
+    r'^relanno_stage_seconds_bucket\{stage="([^"]+)",le="([^"]+)"\} (\S+)$'
+)
+
+
+def load_inputs(path: str, dct: Optional[str] = None) -> List[dict]:
+    """Load request bodies.
+
+    Args:
+        path (str): a JSONL file of `{"text": ..., "dct": ...}`,
+            or a directory of `.txt` or PRISM `.xml` files (plain texts are used).
+        dct (str, optional): the DCT for texts read from a directory.
+
+    Returns:
+        List[dict]: request bodies.
+    """
+    p = Path(path)
+    if p.is_file():
+        with open(p, "r") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    inputs = []
+    for fp in sorted(p.glob("**/*.txt")):
+        inputs.append({"text": fp.read_text(), "dct": dct})
+    if not inputs:
+        for fp in sorted(p.glob("**/*.xml")):
+            xml = read_prism_xml(fp)
+            if xml:
+                root = ET.fromstring(f"<root>{xml}</root>")
+                inputs.append({"text": x2b.get_plain_text(root), "dct": dct})
+    return inputs
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    ix = min(len(values) - 1, max(0, int(round(q / 100 * len(values) + 0.5)) - 1))
+    return values[ix]
+
+
+def scrape_stage_buckets(metrics_url: str) -> Dict[str, List[Tuple[float, float]]]:
+    """Read cumulative latency buckets per stage from the server."""
+    try:
+        text = requests.get(metrics_url, timeout=10).text
+    except requests.RequestException:
+        return {}
+    buckets: Dict[str, List[Tuple[float, float]]] = {}
+    for line in text.splitlines():
+        m = PTN_BUCKET.match(line)
+        if m:
+            stage, le, count = m.groups()
+            buckets.setdefault(stage, []).append((float(le), float(count)))
+    return buckets
+
+
+def bucket_quantile(q: float, buckets: List[Tuple[float, float]]) -> float:
+    """Estimate a quantile from cumulative buckets like Prometheus' histogram_quantile."""
+    buckets = sorted(buckets)
+    total = buckets[-1][1] if buckets else 0
+    if total <= 0:
+        return float("nan")
+    rank = q / 100 * total
+    prev_le, prev_count = 0.0, 0.0
+    for le, count in buckets:
+        if count >= rank:
+            if le == float("inf"):
+                return prev_le  # cannot interpolate into +Inf
+            if count == prev_count:
+                return le
+            return prev_le + (le - prev_le) * (rank - prev_count) / (count - prev_count)
+        prev_le, prev_count = le, count
+    return prev_le
+
+
+def stage_report(
+    before: Dict[str, List[Tuple[float, float]]],
+    after: Dict[str, List[Tuple[float, float]]],
+) -> Dict[str, Dict[str, float]]:
+    report = {}
+    for stage, buckets in after.items():
+        base = dict(before.get(stage, []))
+        delta = [(le, count - base.get(le, 0)) for le, count in buckets]
+        n = max(count for _, count in delta)
+        if n <= 0:
+            continue
+        report[stage] = {
+            "count": n,
+            "p50": bucket_quantile(50, delta),
+            "p95": bucket_quantile(95, delta),
+            "p99": bucket_quantile(99, delta),
+        }
+    return report
+
+
+def main(
+    inputs: str,
+    url: str = "http://localhost:51235/",
+    rate: float = 10.0,
+    duration: float = 30.0,
+    dct: Optional[str] = None,
+    max_workers: int = 256,
+    timeout: float = 120.0,
+    out: Optional[str] = None,
+):
+    """Drive the API at a target request rate and report latencies.
+
+    Args:
+        inputs (str): request bodies; see `load_inputs`.
+        url (str): the API endpoint to POST.
+        rate (float): requests per second.
+        duration (float): seconds to keep sending requests.
+        dct (str, optional): the DCT for texts read from a directory.
+        max_workers (int): max number of outstanding requests.
+        timeout (float): timeout of each request in seconds.
+        out (str, optional): write the report to this JSON file as well.
+    """
+    bodies = load_inputs(inputs, dct)
+    assert bodies, f"No inputs found in {inputs}"
+    metrics_url = urljoin(url, "/metrics")
+    before = scrape_stage_buckets(metrics_url)
+
+    results: List[Tuple[float, str]] = []  # (latency, outcome)
+    lock = threading.Lock()
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=max_workers))
+
+    def fire_one(body: dict) -> None:
+        t0 = time.perf_counter()
+        try:
+            res = session.post(url, json=body, timeout=timeout)
+            outcome = res.json().get("status", str(res.status_code))
+            if res.status_code != 200:
+                outcome = f"HTTP {res.status_code}"
+        except Exception as e:
+            outcome = type(e).__name__
+        with lock:
+            results.append((time.perf_counter() - t0, outcome))
+
+    n_total = int(rate * duration)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for i in range(n_total):
+            # open loop: keep the schedule regardless of the response times
+            wait = started + i / rate - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            pool.submit(fire_one, bodies[i % len(bodies)])
+    elapsed = time.perf_counter() - started
+
+    after = scrape_stage_buckets(metrics_url)
+    outcomes: Dict[str, int] = {}
+    for _, outcome in results:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    ok = [lat for lat, outcome in results if outcome == "Success"]
+    report = {
+        "requests": len(results),
+        "elapsed": elapsed,
+        "throughput": len(ok) / elapsed,
+        "outcomes": outcomes,
+        "latency": {
+            "p50": percentile(ok, 50),
+            "p95": percentile(ok, 95),
+            "p99": percentile(ok, 99),
+        },
+        "stages": stage_report(before, after),
+    }
+
+    print(f"requests: {report['requests']} in {elapsed:.1f}s", file=sys.stderr)
+    print(f"outcomes: {outcomes}", file=sys.stderr)
+    print(f"throughput: {report['throughput']:.2f} successes/s", file=sys.stderr)
+    print("stage\tcount\tp50\tp95\tp99")
+    lat = report["latency"]
+    print(
+        f"end-to-end\t{len(ok)}\t{lat['p50']:.4f}\t{lat['p95']:.4f}\t{lat['p99']:.4f}"
+    )
+    for stage, st in sorted(report["stages"].items()):
+        print(
+            f"{stage}\t{int(st['count'])}\t{st['p50']:.4f}\t{st['p95']:.4f}\t{st['p99']:.4f}"
+        )
+    if out:
+        with open(out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -1,89 +1,382 @@
 """HeaRT endpoint."""
+import asyncio
 import os
+import time
 import traceback
+import uuid
 from datetime import datetime
-from typing import Union
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
 
-import requests
-from fastapi import FastAPI
+import orjson
+from fastapi import FastAPI, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from tinydb import TinyDB
 
+import jamie
+import metrics
+import patient_store
+import slowlog
+from admission import AdmissionController, Overloaded
+from cache import LRUCache, SharedCache
 from entity_types import Document
 from recover_omit import recover_all
-from visualise_time import main_lib
+from request_log import RequestLog
+from singleflight import SingleFlight
+from visualise_time import SECTIONS, main_lib
 
 
 class Req(BaseModel):
     text: str
     dct: Union[str, None]
+    sections: Union[List[str], None] = None
 
 
-app = FastAPI(debug=True)
+class BatchReq(BaseModel):
+    docs: List[Req]
 
-db = TinyDB("db.json")
 
-JAMIE = os.environ["JAMIE_ENDPOINT"]  # Please specify a JaMIE endpoint URL here.
+class PatientDocReq(BaseModel):
+    text: str
+    dct: Union[str, None]
+    doc_id: Union[str, None] = None  # defaults to a new ID; an existing ID replaces
+
+
+app = FastAPI(debug=True, default_response_class=ORJSONResponse)
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+
+db = RequestLog("db.json")
+
+# max number of documents of a batch processed at the same time
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "4"))
+
+# identical concurrent requests share one computation
+_flight = SingleFlight("process_time")
+_recover_flight = SingleFlight("recover_doc")
+
+# recovered documents before timex normalisation, keyed by text;
+# a request with a new DCT only reruns main_lib
+doc_cache = LRUCache("doc", int(os.environ.get("DOC_CACHE_SIZE", "256")))
+# the second tier shared by the workers on the host, if `SHARED_CACHE` is given
+shared_cache: Optional[SharedCache] = None
+if os.environ.get("SHARED_CACHE"):
+    shared_cache = SharedCache(
+        "doc_shared",
+        os.environ["SHARED_CACHE"],
+        int(os.environ.get("SHARED_CACHE_SIZE", "4096")),
+    )
+
+# captures of slow requests; see slowlog.py
+slow_log = slowlog.from_env()
+
+# per-patient timelines merged from their documents
+patients = patient_store.from_env()
 
+# admission control in front of process_time
+admission = AdmissionController(
+    max_concurrency=int(os.environ.get("MAX_CONCURRENCY", "8")),
+    max_queue=int(os.environ.get("MAX_QUEUE", "32")),
+    queue_timeout=float(os.environ.get("QUEUE_TIMEOUT", "0")),  # 0 = wait forever
+)
 
-def process_time(text: str, dct: Union[str, None] = None):
+
+def process_time(
+    text: str,
+    dct: Union[str, None] = None,
+    sections: Optional[List[str]] = None,
+):
+    metrics.PAYLOAD_BYTES.observe(len(text.encode("utf-8")), "request_text")
+    unknown = set(sections or []) - set(SECTIONS)
+    if unknown:
+        metrics.REQUESTS.inc("Failed")
+        return {
+            "status": "Failed",
+            "message": f"Unknown sections: {sorted(unknown)}; choose from {SECTIONS}",
+        }
+    sections_ = tuple(sorted(set(sections))) if sections else SECTIONS
+    if slow_log is None:
+        with metrics.timed("process_time"):
+            res = _flight.do(
+                (text, dct, sections_), _process_time, text, dct, sections_
+            )
+    else:
+        t0 = time.perf_counter()
+        with metrics.traced() as stages, slow_log.profiling() as prof:
+            with metrics.timed("process_time"):
+                res = _flight.do(
+                    (text, dct, sections_), _process_time, text, dct, sections_
+                )
+        recovered = doc_cache.peek(text)
+        slow_log.record(
+            text,
+            dct,
+            sections_,
+            res["status"],
+            time.perf_counter() - t0,
+            stages,
+            xml_text=recovered[1] if recovered else None,
+            prof=prof,
+        )
+    metrics.REQUESTS.inc(res["status"])
+    return res
+
+
+def _process_time(text: str, dct: Union[str, None], sections: Tuple[str, ...]):
+    recovered = doc_cache.get(text)
+    if recovered is None and shared_cache is not None:
+        recovered = shared_cache.get(text)
+        if recovered is not None:
+            doc_cache.put(text, recovered)
+    if recovered is None:
+        recovered = _recover_flight.do(text, recover_doc, text)
+        if isinstance(recovered, dict):  # failed
+            return recovered
+        doc_cache.put(text, recovered)
+        if shared_cache is not None:
+            shared_cache.put(text, recovered)
+    base_doc, xml_text = recovered
+    # main_lib mutates the document, so keep the cached one intact
+    with metrics.timed("fork_doc"):
+        doc = base_doc.fork()
     try:
-        res_jamie = requests.get(JAMIE, params={"text": text}).json()
+        res_time = main_lib(doc, dct, sections=sections)
+    except Exception:
+        return {
+            "status": "Failed",
+            "message": "Timeline processing failed:\n" + traceback.format_exc(),
+        }
+    db.insert(
+        {
+            "created_at": datetime.now().isoformat(),
+            "text": text,
+            "dct": dct,
+            "xml_text": xml_text,
+            "results": res_time,
+        }
+    )
+    return {"status": "Success", "response": res_time}
+
+
+def recover_doc(text: str) -> Union[dict, Tuple[Document, str]]:
+    """Analyse a text with JaMIE and recover omitted relations.
+
+    The result does not depend on DCT, so it is shared by requests of the same text.
+
+    Returns:
+        Tuple[Document, str]: the recovered document and JaMIE's XML.
+        dict: a `Failed` response if any stage fails.
+    """
+    try:
+        with metrics.timed("jamie"):
+            res_jamie = jamie.analyse(text)
     except:
         return {
             "status": "Failed",
             "message": "JaMIE endpoint is dead:\n" + traceback.format_exc(),
         }
     if res_jamie["status"] != "Success":
+        metrics.STAGE_FAILURES.inc("jamie")
         return {
             "status": "Failed",
             "message": "JaMIE endpoint returns an error:\n" + res_jamie["error"],
         }
     if not res_jamie["text"]:
+        metrics.STAGE_FAILURES.inc("jamie")
         return {
             "status": "Failed",
             "message": "JaMIE returned nothing, without explicit failure.",
         }
     xml_text = "\n".join(res_jamie["text"])
+    metrics.PAYLOAD_BYTES.observe(len(xml_text.encode("utf-8")), "jamie_xml")
     try:
-        doc = Document.from_xml(xml_text)
+        with metrics.timed("from_xml"):
+            doc = Document.from_xml(xml_text)
     except:
         return {
             "status": "Failed",
             "message": "JaMIE returned invalid XML:\n" + xml_text,
         }
     try:
-        recover_all(doc)
+        with metrics.timed("recover_all"):
+            recover_all(doc)
     except:
         return {
             "status": "Failed",
             "message": "Failted to recover omitted entities and relations:\n"
             + xml_text,
         }
-    try:
-        res_time = main_lib(doc, dct)
-    except Exception:
-        return {
-            "status": "Failed",
-            "message": "Timeline processing failed:\n" + traceback.format_exc(),
-        }
-    db.insert(
-        {
-            "created_at": datetime.now().isoformat(),
-            "text": text,
-            "dct": dct,
-            "xml_text": xml_text,
-            "results": res_time,
-        }
+    return doc, xml_text
+
+
+# a tiny document run through the pipeline to load lazily imported modules
+WARMUP_XML = (
+    '<timex3 type="DATE" tid="T1">2014年3月1日</timex3>、'
+    '<d certainty="positive" tid="T2">肺炎</d>を認めた。'
+    '<a tid="T3">右肺</a>に<d certainty="suspicious" tid="T4">腫瘤</d>。'
+    '<brel rid="R1" reltype="timeOn" arg1="T2" arg2="T1"/>'
+)
+
+
+@app.on_event("startup")
+def warmup():
+    """Warm up the worker before it starts serving, if `WARMUP=1`.
+
+    Runs a tiny document through the pipeline, which loads normtime and others,
+    and refills the document cache with the `WARMUP_CACHE` latest logged requests.
+    """
+    if os.environ.get("WARMUP", "0") != "1":
+        return
+    with metrics.timed("warmup"):
+        doc = Document.from_xml(WARMUP_XML)
+        recover_all(doc)
+        main_lib(doc, datetime.now().strftime("%Y-%m-%d"))
+        n_cached = int(os.environ.get("WARMUP_CACHE", "0"))
+        if n_cached > 0:
+            logs = db.all()[-n_cached:]
+            # the latest log of each text, oldest first to end up most recently used
+            latest = {log["text"]: log for log in logs}
+            for log in latest.values():
+                try:
+                    doc = Document.from_xml(log["xml_text"])
+                    recover_all(doc)
+                except Exception:
+                    continue
+                doc_cache.put(log["text"], (doc, log["xml_text"]))
+
+
+@app.middleware("http")
+async def observe_response_size(request: Request, call_next):
+    response = await call_next(request)
+    size = response.headers.get("content-length")
+    if size is not None:  # unknown for streaming responses
+        metrics.PAYLOAD_BYTES.observe(int(size), "response")
+    return response
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
     )
-    return {"status": "Success", "response": res_time}
+
+
+async def admitted_process_time(
+    text: str,
+    dct: Union[str, None] = None,
+    sections: Optional[List[str]] = None,
+) -> dict:
+    """Run `process_time` in the thread pool once admitted.
+
+    Overflowing requests immediately get a `Failed` response with `retry_after`.
+    """
+    try:
+        async with admission.admit():
+            return await run_in_threadpool(process_time, text, dct, sections)
+    except Overloaded as e:
+        metrics.REQUESTS.inc("Rejected")
+        return {"status": "Failed", "message": str(e), "retry_after": e.retry_after}
+
+
+def set_overload_status(res: dict, response: Response) -> dict:
+    if "retry_after" in res:
+        response.status_code = 503
+        response.headers["Retry-After"] = str(res["retry_after"])
+    return res
 
 
 @app.get("/")
-async def root(text: str, dct: Union[str, None] = None):
-    return process_time(text, dct)
+async def root(
+    response: Response,
+    text: str,
+    dct: Union[str, None] = None,
+    sections: Union[str, None] = None,  # comma-separated
+):
+    sections_ = sections.split(",") if sections else None
+    res = await admitted_process_time(text, dct, sections_)
+    return set_overload_status(res, response)
 
 
 @app.post("/")
-async def root_post(req: Req):
-    return process_time(req.text, req.dct)
+async def root_post(req: Req, response: Response):
+    res = await admitted_process_time(req.text, req.dct, req.sections)
+    return set_overload_status(res, response)
+
+
+async def process_batch(docs: List[Req]) -> AsyncIterator[dict]:
+    """Process documents concurrently and yield each result as soon as it is ready.
+
+    Results are yielded in completion order, tagged with `index` of the input.
+    At most `BATCH_CONCURRENCY` documents are in flight,
+    so finished results are never accumulated on the server side.
+    """
+    it = iter(enumerate(docs))
+    pending: Dict[asyncio.Future, int] = {}
+
+    def submit() -> bool:
+        try:
+            ix, doc = next(it)
+        except StopIteration:
+            return False
+        task = asyncio.ensure_future(
+            admitted_process_time(doc.text, doc.dct, doc.sections)
+        )
+        pending[task] = ix
+        return True
+
+    for _ in range(max(BATCH_CONCURRENCY, 1)):
+        if not submit():
+            break
+    while pending:
+        done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            ix = pending.pop(task)
+            submit()
+            yield {"index": ix, **task.result()}
+
+
+async def ndjson_lines(docs: List[Req]) -> AsyncIterator[bytes]:
+    async for res in process_batch(docs):
+        yield orjson.dumps(res) + b"\n"
+
+
+@app.post("/batch")
+async def batch_post(req: BatchReq, stream: bool = False):
+    if stream:
+        return StreamingResponse(
+            ndjson_lines(req.docs), media_type="application/x-ndjson"
+        )
+    results = [res async for res in process_batch(req.docs)]
+    return {"status": "Success", "response": sorted(results, key=lambda r: r["index"])}
+
+
+@app.post("/patients/{patient_id}/documents")
+async def patient_document_post(
+    patient_id: str, req: PatientDocReq, response: Response
+):
+    res = await admitted_process_time(
+        req.text, req.dct, ["entities", "times", "anatomy"]
+    )
+    if res["status"] != "Success":
+        return set_overload_status(res, response)
+    doc_id = req.doc_id or uuid.uuid4().hex
+    try:
+        n_dated = await run_in_threadpool(
+            patients.add_document, patient_id, doc_id, req.dct, res["response"]
+        )
+    except ValueError as e:
+        return {"status": "Failed", "message": str(e)}
+    return {"status": "Success", "doc_id": doc_id, "dated_times": n_dated}
+
+
+@app.get("/patients/{patient_id}/timeline")
+async def patient_timeline(
+    patient_id: str, start: Union[str, None] = None, end: Union[str, None] = None
+):
+    try:
+        res = await run_in_threadpool(patients.query, patient_id, start, end)
+    except ValueError as e:
+        return {"status": "Failed", "message": str(e)}
+    if res is None:
+        return {"status": "Failed", "message": f"Unknown patient: {patient_id}"}
+    return {"status": "Success", "response": res}
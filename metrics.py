@@ -0,0 +1,259 @@
+"""Lightweight in-process metrics exported in the Prometheus text format.
+
+Only counters, gauges and histograms with a fixed set of buckets are supported.
+Each update takes a lock and a bisect, cheap enough to be left on in production.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+)
+SIZE_BUCKETS = (1e2, 1e3, 1e4, 3e4, 1e5, 3e5, 1e6, 3e6, 1e7)
+
+REGISTRY: List["Metric"] = []
+
+# (stage, seconds) of the stages timed in the current context, if being traced
+_trace: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar(
+    "trace", default=None
+)
+
+
+def _fmt_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _fmt_value(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+class Metric:
+    """Base class of a labelled metric."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help_: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def collect(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(lines + self.collect())
+
+
+class Counter(Metric):
+    """Monotonically increasing value."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def get(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_fmt_labels(self.labelnames, lv)} {_fmt_value(v)}"
+            for lv, v in items
+        ]
+
+
+class Gauge(Metric):
+    """Value that can go up and down."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, *labelvalues: str) -> None:
+        with self._lock:
+            self._values[labelvalues] = value
+
+    def get(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_fmt_labels(self.labelnames, lv)} {_fmt_value(v)}"
+            for lv, v in items
+        ]
+
+
+class Histogram(Metric):
+    """Distribution of observed values over fixed buckets."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help_, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label values: [count per bucket (+Inf at the end), sum]
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        ix = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(
+                labelvalues, ([0] * (len(self.buckets) + 1), [0.0])
+            )
+            counts[ix] += 1
+            total[0] += value
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = sorted(
+                (lv, (counts[:], total[0]))
+                for lv, (counts, total) in self._values.items()
+            )
+        lines = []
+        for lv, (counts, total) in items:
+            cum = 0
+            for le, c in zip(list(self.buckets) + ["+Inf"], counts):
+                cum += c
+                le_ = le if le == "+Inf" else _fmt_value(le)
+                labels = _fmt_labels(self.labelnames, lv, f'le="{le_}"')
+                lines.append(f"{self.name}_bucket{labels} {cum}")
+            labels = _fmt_labels(self.labelnames, lv)
+            lines.append(f"{self.name}_sum{labels} {_fmt_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cum}")
+        return lines
+
+
+REQUESTS = Counter(
+    "relanno_requests_total", "Timeline requests by result status.", ["status"]
+)
+STAGE_SECONDS = Histogram(
+    "relanno_stage_seconds",
+    "Latency of each processing stage in seconds (to_json includes to_html).",
+    ["stage"],
+)
+STAGE_FAILURES = Counter(
+    "relanno_stage_failures_total", "Failures by processing stage.", ["stage"]
+)
+COALESCED = Counter(
+    "relanno_coalesced_total",
+    "Calls served by an identical in-flight computation.",
+    ["stage"],
+)
+CACHE_REQUESTS = Counter(
+    "relanno_cache_requests_total", "Cache lookups by result.", ["cache", "result"]
+)
+PAYLOAD_BYTES = Histogram(
+    "relanno_payload_bytes",
+    "Size of request texts, JaMIE outputs and HTTP responses in bytes.",
+    ["kind"],
+    buckets=SIZE_BUCKETS,
+)
+
+ADMISSION_IN_FLIGHT = Gauge(
+    "relanno_admission_in_flight", "Requests being processed after admission."
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "relanno_admission_queue_depth", "Requests waiting for admission."
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "relanno_admission_wait_seconds", "Time spent waiting for admission in seconds."
+)
+ADMISSION_REJECTED = Counter(
+    "relanno_admission_rejected_total",
+    "Requests rejected by admission control.",
+    ["reason"],
+)
+
+SLOW_REQUESTS = Counter(
+    "relanno_slow_requests_total", "Slow requests captured by the slow log."
+)
+
+UPSTREAM_OUTSTANDING = Gauge(
+    "relanno_upstream_outstanding",
+    "Outstanding calls per replica of an upstream API.",
+    ["upstream", "endpoint"],
+)
+UPSTREAM_EJECTIONS = Counter(
+    "relanno_upstream_ejections_total",
+    "Replicas ejected after consecutive failures.",
+    ["upstream", "endpoint"],
+)
+UPSTREAM_HEDGED = Counter(
+    "relanno_upstream_hedged_total",
+    "Hedged calls sent to a second replica, and those answered first by it.",
+    ["upstream", "outcome"],
+)
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Measure the latency of a stage, counting a failure if it raises."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_FAILURES.inc(stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - t0
+        STAGE_SECONDS.observe(elapsed, stage)
+        trace = _trace.get()
+        if trace is not None:
+            trace.append((stage, elapsed))
+
+
+@contextmanager
+def traced() -> Iterator[List[Tuple[str, float]]]:
+    """Collect `(stage, seconds)` of the stages timed in this thread within the block."""
+    trace: List[Tuple[str, float]] = []
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+
+
+def render() -> str:
+    """Render all registered metrics in the Prometheus text format."""
+    return "\n".join(m.render() for m in REGISTRY) + "\n"
@@ -0,0 +1,183 @@
+"""Per-patient timelines merged from the timelines of their documents.
+
+Each document's time containers, i.e. the `times` of `main_lib`'s output,
+are inserted into a list kept sorted by their head's date,
+so that a date range of a long history is served by two bisections
+without recomputing or shipping the other documents.
+"""
+import json
+import os
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from visualise_time import PTN_DATE
+
+Key = Tuple[str, int, str, int]  # (date, sequence, document ID, head ID)
+
+PTN_PATIENT_ID = re.compile(r"[\w-][\w.-]*")  # also used as a file name
+
+
+class PatientTimeline:
+    """The timeline of a patient, sorted by the dates of time container heads.
+
+    Entities are attached to the container of their (start) time.
+    Containers without a date and entities without a time are kept per document
+    and are not part of date-range queries.
+    """
+
+    def __init__(self):
+        self.documents: Dict[str, dict] = {}  # document ID -> dct, anatomy, undated
+        self._keys: List[Key] = []
+        self._slots: List[dict] = []  # parallel to _keys
+        self._seq = 0  # keeps the insertion order among the same date
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, doc_id: str, dct: Optional[str], timeline: dict) -> int:
+        """Merge a document's timeline, replacing an earlier one of the same ID.
+
+        Args:
+            doc_id (str): the document ID.
+            dct (str, optional): the DCT of the document.
+            timeline (dict): `main_lib`'s output with `times` and `entities`.
+
+        Returns:
+            int: the number of dated time containers merged.
+        """
+        if doc_id in self.documents:
+            self.remove(doc_id)
+        self._seq += 1
+        by_head: Dict[int, List[dict]] = {}
+        undated_entities = []
+        for ent in timeline.get("entities", []):
+            if ent.get("time"):
+                by_head.setdefault(ent["time"][0], []).append(ent)
+            else:
+                undated_entities.append(ent)
+
+        n_dated = 0
+        undated_times = []
+        for time in timeline.get("times", []):
+            slot = {
+                "document": doc_id,
+                "time": time,
+                "entities": by_head.pop(time["id"], []),
+            }
+            m = PTN_DATE.match(time["value"])
+            if not m:
+                undated_times.append(slot)
+                continue
+            key = (m.group(0), self._seq, doc_id, time["id"])
+            ix = bisect_right(self._keys, key)
+            self._keys.insert(ix, key)
+            self._slots.insert(ix, slot)
+            n_dated += 1
+        for ents in by_head.values():  # refer to a head not in `times`
+            undated_entities += ents
+
+        self.documents[doc_id] = {
+            "dct": dct,
+            "anatomy": timeline.get("anatomy", []),
+            "undated_times": undated_times,
+            "undated_entities": undated_entities,
+        }
+        return n_dated
+
+    def remove(self, doc_id: str) -> None:
+        """Remove a document's containers."""
+        if self.documents.pop(doc_id, None) is None:
+            return
+        kept = [(k, s) for k, s in zip(self._keys, self._slots) if k[2] != doc_id]
+        self._keys = [k for k, _ in kept]
+        self._slots = [s for _, s in kept]
+
+    def query(self, start: Optional[str] = None, end: Optional[str] = None) -> dict:
+        """Return the containers dated within [start, end] and their documents.
+
+        Args:
+            start (str, optional): YYYY-MM-DD; unbounded if None.
+            end (str, optional): YYYY-MM-DD, inclusive; unbounded if None.
+        """
+        lo = bisect_left(self._keys, (start,)) if start else 0
+        hi = bisect_right(self._keys, (end, float("inf"))) if end else len(self._keys)
+        slots = [
+            dict(slot, date=key[0])
+            for key, slot in zip(self._keys[lo:hi], self._slots[lo:hi])
+        ]
+        doc_ids = {slot["document"] for slot in slots}
+        return {
+            "times": slots,
+            "documents": {
+                doc_id: {
+                    "dct": self.documents[doc_id]["dct"],
+                    "anatomy": self.documents[doc_id]["anatomy"],
+                }
+                for doc_id in sorted(doc_ids)
+            },
+        }
+
+
+class PatientStore:
+    """Timelines of patients, optionally persisted as a JSONL file per patient.
+
+    A persisted patient is loaded on first access by replaying the stored
+    document timelines, which needs no JaMIE nor `main_lib`.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = Path(directory) if directory else None
+        self._patients: Dict[str, PatientTimeline] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, patient_id: str) -> Path:
+        assert self.directory is not None
+        return self.directory / f"{patient_id}.jsonl"
+
+    def _get(self, patient_id: str) -> PatientTimeline:
+        # NOTE: call with the lock held
+        if not PTN_PATIENT_ID.fullmatch(patient_id):
+            raise ValueError(f"Invalid patient ID: {patient_id!r}")
+        pt = self._patients.get(patient_id)
+        if pt is None:
+            pt = self._patients[patient_id] = PatientTimeline()
+            if self.directory is not None and self._path(patient_id).is_file():
+                with open(self._path(patient_id), "r") as f:
+                    for line in f:
+                        rec = json.loads(line)
+                        pt.add(rec["doc_id"], rec["dct"], rec["timeline"])
+        return pt
+
+    def add_document(
+        self, patient_id: str, doc_id: str, dct: Optional[str], timeline: dict
+    ) -> int:
+        """Merge a document's timeline into the patient's; see `PatientTimeline.add`."""
+        with self._lock:
+            n_dated = self._get(patient_id).add(doc_id, dct, timeline)
+            if self.directory is not None:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                rec = {"doc_id": doc_id, "dct": dct, "timeline": timeline}
+                with open(self._path(patient_id), "a") as f:
+                    f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        return n_dated
+
+    def query(
+        self, patient_id: str, start: Optional[str] = None, end: Optional[str] = None
+    ) -> Optional[dict]:
+        """Return the patient's timeline within [start, end]; None if unknown."""
+        with self._lock:
+            if not PTN_PATIENT_ID.fullmatch(patient_id):
+                raise ValueError(f"Invalid patient ID: {patient_id!r}")
+            if patient_id not in self._patients and not (
+                self.directory is not None and self._path(patient_id).is_file()
+            ):
+                return None
+            return self._get(patient_id).query(start, end)
+
+
+def from_env() -> PatientStore:
+    """Build a PatientStore persisted under `PATIENT_STORE_DIR`, if given."""
+    return PatientStore(os.environ.get("PATIENT_STORE_DIR") or None)
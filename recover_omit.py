@@ -8,7 +8,6 @@ import shutil
 import sys
 from pathlib import Path
 
-import fire
 
 from entity_types import Document, Id
 from visualise_time import relate_dct
@@ -158,6 +157,8 @@ def main(
 
 if __name__ == "__main__":
     # main(sys.argv[1])
+    import fire
+
     fire.Fire(main)
     # activate an interactive session to debug
     # by adding `-- --interactive` at the end of exec command
@@ -0,0 +1,46 @@
+"""The TinyDB request log, safe for concurrent writers."""
+import fcntl
+import os
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+from tinydb import TinyDB
+
+
+class RequestLog:
+    """Append-mostly log of requests in a TinyDB file.
+
+    TinyDB rewrites the whole file on every insert, so writers are serialised
+    by a thread lock within a process and by `flock` on a sidecar lock file
+    across processes (e.g. the workers of serve.py).
+    The database is opened per process, so an instance created before `fork`
+    does not share a file offset with its children.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db: Optional[TinyDB] = None
+        self._pid: Optional[int] = None
+
+    @contextmanager
+    def _locked(self) -> Iterator[TinyDB]:
+        with self._lock, open(self.path + ".lock", "a") as lockf:
+            fcntl.flock(lockf, fcntl.LOCK_EX)
+            try:
+                if self._pid != os.getpid():
+                    self._db = TinyDB(self.path)
+                    self._pid = os.getpid()
+                assert self._db is not None
+                yield self._db
+            finally:
+                fcntl.flock(lockf, fcntl.LOCK_UN)
+
+    def insert(self, record: dict) -> None:
+        with self._locked() as db:
+            db.insert(record)
+
+    def all(self) -> List[dict]:
+        with self._locked() as db:
+            return db.all()
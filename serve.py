@@ -0,0 +1,110 @@
+"""Serve the API from pre-forked workers sharing warm state.
+
+The parent imports the app, warms it up (see `main.warmup`) and binds the socket,
+then forks the workers, which share the loaded modules, normtime's resources
+and the warmed document cache copy-on-write.
+The workers accept connections from the same socket; dead workers are replaced.
+
+    $ JAMIE_ENDPOINT=http://localhost:51234/json python serve.py --workers 4
+
+Set `SHARED_CACHE` to share recovered documents among the workers,
+e.g. `SHARED_CACHE=/dev/shm/relanno-cache.sqlite`.
+Each worker exposes its own `/metrics`.
+"""
+import gc
+import os
+import signal
+import socket
+import sys
+from typing import Dict, Optional
+
+import uvicorn
+
+
+def run_worker(app, sock: socket.socket) -> None:
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    config = uvicorn.Config(app, lifespan="on", log_level="info")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def main(
+    workers: Optional[int] = None,
+    host: str = "0.0.0.0",
+    port: int = 51235,
+    warmup: bool = True,
+    backlog: int = 2048,
+):
+    """Run the API with pre-forked workers.
+
+    Args:
+        workers (int, optional): number of worker processes. Defaults to #CPUs.
+        host (str): host to bind.
+        port (int): port to listen.
+        warmup (bool): set False to skip warming up before forking.
+        backlog (int): the listen backlog of the shared socket.
+    """
+    workers = workers or os.cpu_count() or 1
+    if warmup:
+        os.environ["WARMUP"] = "1"
+    import main as api  # heavy imports happen here, once
+
+    api.warmup()
+    os.environ["WARMUP"] = "0"  # already warm; do not repeat it in each worker
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+
+    # keep the warmed objects out of the GC's reach so that collections in
+    # the workers do not touch (and copy) their pages
+    gc.collect()
+    gc.freeze()
+
+    children: Dict[int, int] = {}  # pid -> worker slot
+    stopping = False
+
+    def spawn(slot: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(api.app, sock)
+            finally:
+                os._exit(0)
+        children[pid] = slot
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for slot in range(workers):
+        spawn(slot)
+    print(f"serving on {host}:{port} with {workers} workers", file=sys.stderr)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        slot = children.pop(pid, None)
+        if slot is not None and not stopping:
+            print(f"worker {pid} exited ({status}); respawning", file=sys.stderr)
+            spawn(slot)
+    sock.close()
+
+
+if __name__ == "__main__":
+    import fire
+
+    fire.Fire(main)
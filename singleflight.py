@@ -0,0 +1,45 @@
+"""Coalesce concurrent calls of the same computation."""
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, TypeVar
+
+import metrics
+
+A = TypeVar("A")
+
+
+class SingleFlight:
+    """Let concurrent callers with the same key share one in-flight call.
+
+    The first caller of a key runs the function;
+    the others block until it finishes and receive the same result (or exception).
+    Nothing is cached: once the call finishes, the next caller runs it again.
+    """
+
+    def __init__(self, name: str):
+        self.name = name  # used as the metrics label
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, fn: Callable[..., A], *args, **kwargs) -> A:
+        with self._lock:
+            fut = self._calls.get(key)
+            is_leader = fut is None
+            if is_leader:
+                fut = Future()
+                self._calls[key] = fut
+        if not is_leader:
+            metrics.COALESCED.inc(self.name)
+            return fut.result()
+
+        try:
+            res = fn(*args, **kwargs)
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        else:
+            fut.set_result(res)
+            return res
+        finally:
+            with self._lock:
+                del self._calls[key]
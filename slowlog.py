@@ -0,0 +1,200 @@
+"""Capture slow requests for offline investigation.
+
+A request taking longer than a threshold is saved to a directory of its own:
+
+- `request.json`: the text, DCT, sections, status, latency and per-stage breakdown
+- `jamie.xml`: JaMIE's output, if it got that far
+- `profile.prof`: a cProfile dump, if the request was sampled for profiling
+
+Only the latest `max_entries` captures are kept.
+A capture can be replayed without the API or JaMIE:
+
+    $ python slowlog.py list slowlog/
+    $ python slowlog.py replay slowlog/20240101-120000-000000-0123456789ab --profile
+"""
+import cProfile
+import hashlib
+import io
+import json
+import os
+import pstats
+import random
+import shutil
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import metrics
+
+
+class SlowLog:
+    """Save requests slower than `threshold` seconds under `directory`.
+
+    `profile_rate` of the requests run under cProfile (which slows them down)
+    so that a slow one comes with its profile.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        threshold: float,
+        max_entries: int = 100,
+        profile_rate: float = 0.0,
+    ):
+        self.directory = Path(directory)
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.profile_rate = profile_rate
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def profiling(self) -> Iterator[Optional[cProfile.Profile]]:
+        """Profile the block if sampled; yields the profiler or None."""
+        if random.random() >= self.profile_rate:
+            yield None
+            return
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            yield prof
+        finally:
+            prof.disable()
+
+    def record(
+        self,
+        text: str,
+        dct: Optional[str],
+        sections: Sequence[str],
+        status: str,
+        elapsed: float,
+        stages: List[Tuple[str, float]],
+        xml_text: Optional[str] = None,
+        prof: Optional[cProfile.Profile] = None,
+    ) -> Optional[Path]:
+        """Save a request if it was slow.
+
+        Returns:
+            Path: the directory of the capture, or None if not saved.
+        """
+        if elapsed < self.threshold:
+            return None
+        key = json.dumps([text, dct, list(sections)], ensure_ascii=False)
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            if any(self.directory.glob(f"*-{digest}")):
+                return None  # the same request was captured already
+            name = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{digest}"
+            tmp = self.directory / f".{name}"
+            tmp.mkdir()
+            with open(tmp / "request.json", "w") as f:
+                json.dump(
+                    {
+                        "text": text,
+                        "dct": dct,
+                        "sections": list(sections),
+                        "status": status,
+                        "elapsed": elapsed,
+                        "stages": stages,
+                        "created_at": datetime.now().isoformat(),
+                    },
+                    f,
+                    ensure_ascii=False,
+                    indent=2,
+                )
+            if xml_text is not None:
+                (tmp / "jamie.xml").write_text(xml_text)
+            if prof is not None:
+                prof.dump_stats(str(tmp / "profile.prof"))
+            os.rename(tmp, self.directory / name)
+            self._evict()
+        metrics.SLOW_REQUESTS.inc()
+        return self.directory / name
+
+    def _evict(self) -> None:
+        entries = sorted(p for p in self.directory.iterdir() if p.name[0] != ".")
+        for old in entries[: max(len(entries) - self.max_entries, 0)]:
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def from_env() -> Optional[SlowLog]:
+    """Build a SlowLog from `SLOWLOG_*` environment variables; None if disabled."""
+    directory = os.environ.get("SLOWLOG_DIR")
+    if not directory:
+        return None
+    return SlowLog(
+        directory,
+        threshold=float(os.environ.get("SLOWLOG_THRESHOLD", "5")),
+        max_entries=int(os.environ.get("SLOWLOG_MAX_ENTRIES", "100")),
+        profile_rate=float(os.environ.get("SLOWLOG_PROFILE_RATE", "0")),
+    )
+
+
+def list_entries(directory: str = "slowlog"):
+    """List captured requests, slowest first."""
+    rows = []
+    for p in Path(directory).iterdir():
+        if p.name[0] == "." or not (p / "request.json").is_file():
+            continue
+        with open(p / "request.json", "r") as f:
+            req = json.load(f)
+        stages = [s for s in req["stages"] if s[0] != "process_time"]
+        slowest = max(stages, key=lambda s: s[1], default=("-", 0))
+        rows.append((req["elapsed"], p.name, req["status"], slowest, len(req["text"])))
+    print("elapsed\tentry\tstatus\tslowest stage\tchars")
+    for elapsed, name, status, (stage, sec), n_chars in sorted(rows, reverse=True):
+        print(f"{elapsed:.3f}\t{name}\t{status}\t{stage} ({sec:.3f})\t{n_chars}")
+
+
+def replay(entry: str, profile: bool = False, top: int = 30):
+    """Rerun a captured request from its JaMIE XML and print the stage breakdown.
+
+    Args:
+        entry (str): a capture directory.
+        profile (bool): set True to print the cProfile stats of the replay.
+        top (int): number of functions to print in the stats.
+    """
+    from entity_types import Document
+    from recover_omit import recover_all
+    from visualise_time import main_lib
+
+    p = Path(entry)
+    with open(p / "request.json", "r") as f:
+        req = json.load(f)
+    if not (p / "jamie.xml").is_file():
+        sys.exit(f"{entry} has no JaMIE output to replay (status: {req['status']})")
+    xml_text = (p / "jamie.xml").read_text()
+
+    prof = cProfile.Profile() if profile else None
+    t0 = time.perf_counter()
+    with metrics.traced() as stages:
+        if prof is not None:
+            prof.enable()
+        with metrics.timed("from_xml"):
+            doc = Document.from_xml(xml_text)
+        with metrics.timed("recover_all"):
+            recover_all(doc)
+        main_lib(doc, req["dct"], sections=req["sections"])
+        if prof is not None:
+            prof.disable()
+    elapsed = time.perf_counter() - t0
+
+    print("stage\tcaptured\treplayed")
+    captured = dict(req["stages"])
+    for stage, sec in stages:
+        print(f"{stage}\t{captured.get(stage, float('nan')):.4f}\t{sec:.4f}")
+    print(f"total\t{req['elapsed']:.4f}\t{elapsed:.4f}")
+    if prof is not None:
+        out = io.StringIO()
+        pstats.Stats(prof, stream=out).sort_stats("cumulative").print_stats(top)
+        print(out.getvalue())
+
+
+if __name__ == "__main__":
+    import fire
+
+    fire.Fire({"list": list_entries, "replay": replay})
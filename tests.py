@@ -1,6 +1,12 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
 import pytest
 
 from entity_types import Document
+from patient_store import PatientTimeline
 import visualise_time as vt
 
 DOC = Document("data/sample001-r.ann")
@@ -28,3 +34,51 @@ def test_parse_duration_value():
 
 # def test_tc_compare():
 #     pass
+
+
+def test_document_fork():
+    base = Document("data/sample001-r.ann")
+    before = [(e.id, dict(e.attrs), len(e.rels_to)) for e in base.entities]
+    for dct in ["2014-03-20", "2015-01-01"]:
+        expected = vt.main_lib(Document("data/sample001-r.ann"), dct)
+        assert vt.main_lib(base.fork(), dct) == expected
+    after = [(e.id, dict(e.attrs), len(e.rels_to)) for e in base.entities]
+    assert before == after, "forks must not modify the original"
+
+
+def test_api_import_is_light(tmp_path):
+    code = (
+        "import sys, time; t0 = time.perf_counter(); import main; "
+        "print(time.perf_counter() - t0); "
+        "print([m for m in ('pandas', 'tqdm', 'fire', 'normtime') if m in sys.modules])"
+    )
+    env = dict(
+        os.environ,
+        PYTHONPATH=str(Path(__file__).resolve().parent),
+        JAMIE_ENDPOINT="http://localhost:51234/json",
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=tmp_path,  # db.json is created there
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.splitlines()
+    print(f"import main: {float(out[0]):.3f}s")
+    assert out[1] == "[]", "heavy modules must be imported lazily"
+
+
+def test_patient_timeline_query():
+    pt = PatientTimeline()
+    for doc_id, dct in [("d1", "2014-03-20"), ("d2", "2013-01-01")]:
+        pt.add(doc_id, dct, vt.main_lib(Document("data/sample001-r.ann"), dct))
+    everything = pt.query()["times"]
+    assert [slot["date"] for slot in everything] == sorted(
+        slot["date"] for slot in everything
+    )
+    window = pt.query("2014-01-01", "2014-12-31")
+    assert all("2014-01-01" <= slot["date"] <= "2014-12-31" for slot in window["times"])
+    assert set(window["documents"]) <= {"d1", "d2"}
+    pt.add("d1", "2014-03-20", {"times": [], "entities": []})  # replace
+    assert all(slot["document"] == "d2" for slot in pt.query()["times"])
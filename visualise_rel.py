@@ -2,7 +2,6 @@
 import sys
 from typing import List, Dict, Set
 
-import fire
 
 from entity_types import Id, Document, Entity, Relation
 
@@ -160,4 +159,6 @@ def main(filename_r: str) -> None:  # , tree: bool = False , table: bool = False
 
 
 if __name__ == "__main__":
+    import fire
+
     fire.Fire(main)
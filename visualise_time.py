@@ -7,11 +7,10 @@ from collections import Counter
 from datetime import date, datetime, timedelta
 from typing import Dict, Iterable, List, Optional, Set, Union
 
-import fire
 from dateutil.relativedelta import relativedelta
-from normtime import normalize
 from toposort import CircularDependencyError, toposort_flatten
 
+import metrics
 import visualise_rel as vr
 from entity_types import Document, Entity, Id, Relation
 from visualise_rel import CLR, DOTHEAD
@@ -36,6 +35,14 @@ LIT_begin = "timeStart"
 LIT_end = "timeEnd"
 TREL_NOT_ON = {LIT_on, LIT_before, LIT_after, LIT_begin, LIT_end}
 
+# sections of the JSON output for HeaRT
+SECTIONS = ("entities", "times", "anatomy", "html", "garbage")
+
+
+def _dot_id(id_: Id) -> Id:
+    # NOTE: dirty hack for negative id nodes (DCT, in our case)
+    return Id(10000) if id_ == Id(-1) else id_
+
 
 def generate_dot(doc: Document) -> str:
     """Draw a chronologically aligned dot graph."""
@@ -46,21 +53,14 @@ def generate_dot(doc: Document) -> str:
     # ids = [e.id for e in entities]
     # Define all nodes first
     for ent in entities:
-        if ent.id == Id(-1):
-            ent.id = Id(10000)
         label = vr._make_dot_label(ent)
-        output += f'T{ent.id}  [label="{label}",fillcolor="{CLR[ent.tag]}"];\n'
+        output += f'T{_dot_id(ent.id)}  [label="{label}",fillcolor="{CLR[ent.tag]}"];\n'
     for rel in doc.relations:
         if rel.name in rel.basic_rels:
             output += f'T{rel.arg1} -> T{rel.arg2} [label="{rel.name}"];\n'
         # if rel.arg1 in ids and rel.arg2 in ids:
         if rel.name in rel.time_rels and not rel.name.startswith("o"):
-            # NOTE: dirty hack for negative id nodes (DCT, in our case)
-            if rel.arg1 == Id(-1):
-                rel.arg1 = Id(10000)
-            if rel.arg2 == Id(-1):
-                rel.arg2 = Id(10000)
-            output += f'T{rel.arg1} -> T{rel.arg2} [label="{rel.name}",color="magenta",fontcolor="magenta"];\n'
+            output += f'T{_dot_id(rel.arg1)} -> T{_dot_id(rel.arg2)} [label="{rel.name}",color="magenta",fontcolor="magenta"];\n'
 
     # create time containers
     containers = make_time_containers([e for e in doc.entities if e.tag == "TIMEX3"])
@@ -68,7 +68,9 @@ def generate_dot(doc: Document) -> str:
     # define the timeline
     # FIXME: chronological ordering
     output += "{ "
-    output += " -> ".join([f"T{container.head.id}" for container in containers])
+    output += " -> ".join(
+        [f"T{_dot_id(container.head.id)}" for container in containers]
+    )
     output += " [arrowhead=none] }\n"
 
     for ix, container in enumerate(containers):
@@ -76,7 +78,7 @@ def generate_dot(doc: Document) -> str:
         # まずは rank constraint なしで time container を cluster subgraph して様子見
         output += (
             f"subgraph cluster{ix}{{ rank=same; ordering=out;"
-            + "; ".join([f"T{e.id}" for e in container.all_ents()])
+            + "; ".join([f"T{_dot_id(e.id)}" for e in container.all_ents()])
             # + "; ".join([f"T{e.id}" for e in container.t_ents])
             + "; }\n"
         )
@@ -629,6 +631,8 @@ def normalise_all_timex(doc: Document, dct: str) -> None:
         doc (Document): the document to process
         dct (str): document creation time
     """
+    from normtime import normalize  # slow to import; loaded on first use
+
     for entity in doc.entities:
         if entity.tag != "TIMEX3":
             continue
@@ -670,7 +674,12 @@ def toposort_region_value(ents: Iterable[Entity]) -> List[Entity]:
 
 
 def to_json(
-    tcs: List[TimeContainer], doc: Document, garbage: bool = True, obj=False
+    tcs: List[TimeContainer],
+    doc: Document,
+    garbage: bool = True,
+    obj=False,
+    html: bool = True,
+    indent: Optional[int] = 2,
 ) -> Union[str, dict]:
     """Convert time containers to JSON.
 
@@ -680,6 +689,10 @@ def to_json(
         garbage (bool, optional): set True if garbage entities needed in the output.
                                     Defaults to True.
         obj (bool, optional): set True to get a Dict object.
+        html (bool, optional): set True if the HTML rendering needed in the output.
+                                    Defaults to True.
+        indent (int, optional): indent of the JSON string; None for compact output.
+                                    Defaults to 2.
 
     Returns:
         str: JSON string
@@ -736,7 +749,8 @@ def to_json(
     for doe in doc.entities:
         if doe.id not in embeded_ids:
             if doe.tag in ["Change", "Feature"]:
-                garbage_.append(embed_garbage(doe))
+                if garbage:
+                    garbage_.append(embed_garbage(doe))
             else:
                 # TCに入っておらず，start/end/after/beforeだけついてるentの取り扱い
                 ts = infer_timespan(doe, tcs)
@@ -745,7 +759,7 @@ def to_json(
                     rest_ent = embed_entity(doe, tcs, embeded_ids)
                     rest_ent["time"] = ts
                     entities.append(rest_ent)
-                else:
+                elif garbage:
                     # どこにも入ってないものをgarbageにいれる
                     garbage_.append(embed_garbage(doe))
 
@@ -753,12 +767,17 @@ def to_json(
         "entities": entities,
         "times": times,
         "anatomy": anatomy,
-        "html": doc.to_html(),
     }
+    if html:
+        with metrics.timed("to_html"):
+            ret["html"] = doc.to_html()
     if garbage:
         ret["garbage"] = garbage_
 
-    return ret if obj else json.dumps(ret, ensure_ascii=False, indent=2)
+    if obj:
+        return ret
+    separators = None if indent is not None else (",", ":")
+    return json.dumps(ret, ensure_ascii=False, indent=indent, separators=separators)
 
 
 def find_head_id(id_: Id, tcs: List[TimeContainer]) -> Id:
@@ -1012,17 +1031,41 @@ def trace_region(embeded, e_ids):
     return e_ids
 
 
-def main_lib(doc, dct=None):
-    """MAIN for being called from library."""
-    relate_dct(doc)
+def main_lib(doc, dct=None, sections=None):
+    """MAIN for being called from library.
+
+    Args:
+        doc (Document): a recovered document.
+        dct (str, optional): the document creation time. Defaults to today.
+        sections (Iterable[str], optional): sections to output out of `SECTIONS`.
+            Unrequested sections are not computed. Defaults to all.
+
+    Returns:
+        dict: a JSON object for HeaRT.
+    """
+    sections = set(sections or SECTIONS)
+    with metrics.timed("relate_dct"):
+        relate_dct(doc)
     if not dct:
         dct = date.today().isoformat()
-    normalise_all_timex(doc, dct)
-    containers = make_time_containers([e for e in doc.entities if e.tag == "TIMEX3"])
-    return to_json(containers, doc, obj=True)
+    with metrics.timed("normalise_all_timex"):
+        normalise_all_timex(doc, dct)
+    with metrics.timed("make_time_containers"):
+        containers = make_time_containers(
+            [e for e in doc.entities if e.tag == "TIMEX3"]
+        )
+    with metrics.timed("to_json"):
+        ret = to_json(
+            containers,
+            doc,
+            garbage="garbage" in sections,
+            obj=True,
+            html="html" in sections,
+        )
+    return {k: v for k, v in ret.items() if k in sections}
 
 
-def main(filename_r, dct, debug=False, dot=False, repl=False):
+def main(filename_r, dct, debug=False, dot=False, repl=False, compact=False):
     """MAIN.
 
     Args:
@@ -1034,6 +1077,8 @@ def main(filename_r, dct, debug=False, dot=False, repl=False):
                                 Defaults to False, i.e. JSON for HeaRT is default.
         repl (bool, optional): set True to investigate processed objects with python-fire.
                                 Defaults to False.
+        compact (bool, optional): set True to output JSON without indentation.
+                                Defaults to False.
 
     Returns:
         Tuple[Document, List[containers]]: only if repl=True.
@@ -1058,11 +1103,13 @@ def main(filename_r, dct, debug=False, dot=False, repl=False):
         if dot:
             print(generate_dot(doc))
         else:
-            print(to_json(containers, doc))
+            print(to_json(containers, doc, indent=None if compact else 2))
 
     if repl:
         return (doc, containers)
 
 
 if __name__ == "__main__":
+    import fire
+
     fire.Fire(main)
@@ -1,16 +1,7 @@
 import xml.etree.ElementTree as ET
 from pathlib import Path
 
-import fire
-import pandas as pd
-from tqdm import tqdm
-
-# pd.set_option("display.max_colwidth", None)
-pd.set_option("display.unicode.east_asian_width", True)
-pd.set_option("display.unicode.ambiguous_as_wide", True)
-pd.set_option("display.max_rows", None)
-# pd.set_option("display.max_columns", None)
-pd.set_option("display.max_colwidth", 15)
+from typing import List
 
 TAGNAMES = {
     "d": "Disease",
@@ -31,6 +22,19 @@ TAGNAMES = {
 # TODO: Relation!
 
 
+def _pandas():
+    """Import pandas on first use; the API path does not need it."""
+    import pandas as pd
+
+    # pd.set_option("display.max_colwidth", None)
+    pd.set_option("display.unicode.east_asian_width", True)
+    pd.set_option("display.unicode.ambiguous_as_wide", True)
+    pd.set_option("display.max_rows", None)
+    # pd.set_option("display.max_columns", None)
+    pd.set_option("display.max_colwidth", 15)
+    return pd
+
+
 def len_null(a):
     """Return length of the input even if it is None (=> 0)."""
     return 0 if a is None else len(a)
@@ -80,6 +84,7 @@ def root_to_df(root, plain_text):
         # else:
         #     # some unknown tags exist
         #     # TODO: to make this procedure robust
+    pd = _pandas()
     header = [
         "tag",
         "attrib",
@@ -149,6 +154,46 @@ def df_to_relstrs(df_r):
     return df_r.apply(row_to_relstr, axis=1).to_list()
 
 
+def root_to_annstrs(root, plain_text) -> List[str]:
+    """Convert an XML object to ANN-formatted strings without pandas.
+
+    Equivalent to `df_to_tagstrs`, `df_to_attrstrs` and `df_to_relstrs`
+    applied to the result of `root_to_df`, but much cheaper for a single document.
+    """
+    tagstrs, attrstrs, relstrs = [], [], []
+    # NOTE: assume that non-PRISM tags don't appear between <root>...<[first PRISM tag]>
+    root.text = root.text.lstrip() if root.text else None
+    root.tail = None
+    csr = len(root.text) if root.text else 0
+    has_tid = None
+    for e in root.iter():
+        if e.tag.lower() in TAGNAMES:
+            st, ed = csr, csr + len(e.text) if e.text else csr
+            assert e.text == plain_text[st:ed], f"{e.text!r} != {plain_text[st:ed]!r}"
+            if has_tid is None:  # the first tag decides as in root_to_df
+                has_tid = "tid" in e.attrib
+            id_ = int(e.attrib.pop("tid")[1:]) if has_tid else len(tagstrs)
+            tag = TAGNAMES[e.tag.lower()]
+            if "\n" not in e.text:  # assume #\n == 1 (more than that is illegal)
+                tagstrs.append(f"T{id_}\t{tag} {st} {ed}\t{e.text}")
+            else:
+                fend_pos = st + e.text.find("\n")
+                text_ = e.text.replace("\n", " ")
+                tagstrs.append(
+                    f"T{id_}\t{tag} {st} {fend_pos};{fend_pos + 1} {ed}\t{text_}"
+                )
+            if e.attrib:
+                key, val = list(e.attrib.items())[0]
+                attrstrs.append(f"A{len(attrstrs) + 1}\t{key} T{id_} {val}")
+            csr += len_null(e.text) + len_null(e.tail)
+        if e.tag == "brel":
+            relstrs.append(
+                f"R{int(e.attrib['rid'][1:])}\t{e.attrib['reltype']} "
+                f"Arg1:T{int(e.attrib['arg1'][1:])} Arg2:T{int(e.attrib['arg2'][1:])}"
+            )
+    return tagstrs + attrstrs + relstrs
+
+
 def get_first_child(elem):
     """Get the first child of an XML Element"""
     it = elem.iter()
@@ -166,6 +211,8 @@ def get_real_root(elem):
 
 def main(dirpath, output_path, trav=False):
     """MAIN."""
+    from tqdm import tqdm
+
     p = Path(dirpath)
     assert p.is_dir()
     p_lst = list(p.iterdir())
@@ -212,5 +259,7 @@ def main(dirpath, output_path, trav=False):
 
 
 if __name__ == "__main__":
+    import fire
+
     fire.Fire(main)
     # NOTE: only compatible with the 1-doc-per-file format